@@ -0,0 +1,122 @@
+import hashlib
+import re
+import secrets
+import time
+
+from psycopg2 import errors, sql
+
+# --- CONFIGURATION ---
+# User ids are chosen by the operator when a household is added (see `python app.py add-user`)
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,48}$")
+# Browsers authenticate with this cookie, set once by opening /?token=<token>
+TOKEN_COOKIE = "wardrobe_token"
+# How long a resolved token is trusted before it is looked up again (revocation delay)
+TOKEN_CACHE_SECONDS = 300
+
+# token hash -> (user_id, expires_at)
+_token_cache = {}
+_known_partitions = set()
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_from_request(headers, cookies):
+    """
+    Returns the caller's access token: an "Authorization: Bearer <token>" header
+    (hardware rig, Raspberry Pi) or the browser cookie, or None.
+    """
+    auth = headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        return auth[len("Bearer "):].strip() or None
+    return cookies.get(TOKEN_COOKIE) or None
+
+
+def cached_user(token):
+    """
+    Returns the user id for a token resolved in the last TOKEN_CACHE_SECONDS,
+    or None, without touching the database.
+    """
+    cached = _token_cache.get(hash_token(token))
+    if cached and cached[1] > time.time():
+        return cached[0]
+    return None
+
+
+def lookup_user(cur, token):
+    """
+    Resolves an access token to its user id, or None if it is unknown.
+    Only the SHA-256 of each token is stored in wardrobe_users.
+    """
+    user_id = cached_user(token)
+    if user_id:
+        return user_id
+
+    token_hash = hash_token(token)
+    cur.execute("SELECT user_id FROM wardrobe_users WHERE token_hash = %s", (token_hash,))
+    row = cur.fetchone()
+    if not row:
+        _token_cache.pop(token_hash, None)
+        return None
+    _token_cache[token_hash] = (row[0], time.time() + TOKEN_CACHE_SECONDS)
+    return row[0]
+
+
+def create_user(cur, user_id):
+    """
+    Registers a user (or rotates their token) and creates their partition.
+    Returns the new access token; it is shown once and never stored in clear.
+    """
+    if not USER_ID_PATTERN.match(user_id):
+        raise ValueError("User ids may only contain letters, digits, '-' and '_' (max 48)")
+    token = secrets.token_urlsafe(32)
+    cur.execute("""
+        INSERT INTO wardrobe_users (user_id, token_hash) VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET token_hash = EXCLUDED.token_hash
+    """, (user_id, hash_token(token)))
+    cur.connection.commit()
+    _token_cache.clear()
+    ensure_user_partition(cur, user_id)
+    return token
+
+
+def partition_name(user_id):
+    # Derived from a hash so it can never collide with hand-made tables such as
+    # wardrobe_items_legacy, and always fits Postgres' 63-character identifier limit
+    return f"wardrobe_items_u_{hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:16]}"
+
+
+def user_partition_exists(cur, user_id):
+    cur.execute("""
+        SELECT 1
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'wardrobe_items'::regclass
+          AND pg_get_expr(c.relpartbound, c.oid) = %s
+    """, (f"FOR VALUES IN ('{user_id}')",))
+    return cur.fetchone() is not None
+
+
+def ensure_user_partition(cur, user_id):
+    """
+    Creates the user's wardrobe_items partition on first use. Indexes declared
+    on the parent table (including the vector indexes) are created on the new
+    partition automatically, so each user gets partition-local ANN indexes.
+    """
+    if user_id in _known_partitions:
+        return
+    if not user_partition_exists(cur, user_id):
+        try:
+            cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF wardrobe_items FOR VALUES IN ({})").format(
+                sql.Identifier(partition_name(user_id)),
+                sql.Literal(user_id)
+            ))
+            # Commit the DDL on its own so a failed insert afterwards does not roll the partition back
+            cur.connection.commit()
+        except (errors.DuplicateTable, errors.UniqueViolation):
+            # Another request created it concurrently; anything else is a real name clash
+            cur.connection.rollback()
+            if not user_partition_exists(cur, user_id):
+                raise
+    _known_partitions.add(user_id)
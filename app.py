@@ -1,16 +1,21 @@
 import os
 import json
 import time
+import sys
 import psycopg2
 import vertexai
 import numpy as np
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, redirect
 from vertexai.generative_models import GenerativeModel, Part, Image
 from vertexai.vision_models import MultiModalEmbeddingModel, Image as VertexImage
 from vertexai.language_models import TextEmbeddingModel  
 import base64
 from io import BytesIO
 import re
+from prompt_builder import build_prompt, encode_json_indented, estimate_tokens, get_instruction_model
+from retrieval import parse_context_hints, retrieve_balanced_candidates
+from tactile import extract_tactile_features, parse_tactile_samples, parse_tactile_vector
+from accounts import TOKEN_COOKIE, cached_user, create_user, ensure_user_partition, lookup_user, token_from_request
 
 # --- CONFIGURATION ---
 PROJECT_ID = "PROJECT_ID"
@@ -20,14 +25,23 @@ DB_NAME = "postgres"
 DB_USER = "postgres"
 DB_PASS = "**"
 
+# Multi-user: every request authenticates with a per-user access token (see accounts.py)
+# and only sees that user's partition of wardrobe_items (see schema.sql).
+
+# Prompt size limit per agent call (estimated tokens, text only; the image part is extra)
+PROMPT_TOKEN_BUDGET = 1500
+# Cache the static agent instructions with Vertex context caching. The current prefixes are
+# below Vertex's minimum cacheable size, so they use the local prefix until they grow.
+USE_VERTEX_CONTEXT_CACHE = True
+
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
 # Initialize Models
 # Ingestion Model (Fast)
 model_ingest = GenerativeModel("gemini-2.5-flash") 
-# Reasoning/Agent Model (High Intelligence)
-model_brain = GenerativeModel("gemini-2.5-flash") 
+# Reasoning/Agent Model (High Intelligence), loaded per agent with its cached instructions
+BRAIN_MODEL_NAME = "gemini-2.5-flash"
 # Embedding Model
 model_embedding = MultiModalEmbeddingModel.from_pretrained("multimodalembedding")
 
@@ -45,6 +59,26 @@ def get_db_connection():
     )
     return conn
 
+# --- REQUEST HELPERS ---
+def get_user_id(token=None):
+    """
+    Returns the wardrobe owner authenticated by the access token (by default
+    the request's), or None if the token is missing or unknown.
+    Recently seen tokens are answered from the token cache without a database connection.
+    """
+    token = token or token_from_request(request.headers, request.cookies)
+    if not token:
+        return None
+    user_id = cached_user(token)
+    if user_id:
+        return user_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+    user_id = lookup_user(cur, token)
+    cur.close()
+    conn.close()
+    return user_id
+
 # --- CORE AI FUNCTIONS ---
 
 def generate_embeddings(image_bytes, text_description=None):
@@ -101,14 +135,89 @@ def analyze_garment(image_bytes, tactile_data):
 
 
 
+# --- AGENT INSTRUCTIONS ---
+# Static prompt prefixes; they never change between requests so each agent's model is
+# built once with them (see prompt_builder.get_instruction_model) and only the request
+# data is assembled per call.
+
+STYLIST_INSTRUCTIONS = """
+You are an expert fashion stylist.
+Each request gives the user's context, a target formality and a table of wardrobe candidates
+(pipe-separated, first row is the header; @N codes are defined in the Legend line).
+The group column is the outfit category the item fills.
+
+Task: Create a complete outfit for the context by selecting at most one item from each group
+(a dress can replace a top and bottom). Pick 2-4 items in total.
+
+Output Requirement: You MUST return ONLY raw JSON with this exact structure:
+{
+    "explanation": "A short, friendly stylist note explaining why these items work together for the context.",
+    "item_ids": [id1, id2]
+}
+Do not use markdown block quotes. Just the raw JSON string.
+"""
+
+VISUAL_MATCH_INSTRUCTIONS = """
+You are an expert fashion stylist.
+
+Task: Create a complete outfit.
+1. Look at the input image provided (this is the item the user wants to wear).
+2. Look at the inventory table from their closet given with the image
+   (pipe-separated, first row is the header; @N codes are defined in the Legend line).
+3. Select exactly 3 distinct items from the inventory that best complement the input image to create a stylish, complete outfit.
+Exclude items that are too similar to the input (e.g., if input is shoes, don't pick other shoes).
+If input is a top, do not pick another top unless it is a blazer or a cardigan or part of an ensemble.
+If input is a bottom, do not pick another bottom unless it is part of an ensemble.
+
+Output Requirement:
+Return ONLY a raw JSON list of the 3 selected item IDs. Do not use markdown formatting.
+Example format: [15, 4, 22]
+"""
+
+
+def encode_stylist_lines(candidates, fields):
+    """
+    The free-form line encoding the stylist used before compaction,
+    kept only to report the tokens the compact table saves.
+    """
+    lines = ""
+    current_group = None
+    for c in sorted(candidates, key=lambda c: c["group"]):
+        if c["group"] != current_group:
+            current_group = c["group"]
+            lines += f"[{current_group}]\n"
+        lines += f"- ID {c['id']}: {c['color']} {c['category']} (Material: {c['material']}, Season: {c['season']})\n"
+    return lines
+
+
 # --- ROUTES ---
 
 @app.route('/')
 def index():
+    # Opening /?token=<token> once stores the token in a cookie and drops it from the URL.
+    # Unknown tokens (typos, made-up links) are rejected without touching the cookie.
+    token = request.args.get('token')
+    if token:
+        if not get_user_id(token):
+            return "Unknown access token", 401
+        response = redirect('/')
+        response.set_cookie(TOKEN_COOKIE, token, httponly=True, samesite='Strict', secure=request.is_secure,
+                            max_age=60 * 60 * 24 * 365)
+        return response
+
+    user_id = get_user_id()
+    if not user_id:
+        return "Not signed in. Open this page once as /?token=<your-access-token>", 401
+
     conn = get_db_connection()
     cur = conn.cursor()
     # Fetch image_base64 instead of image_path
-    cur.execute("SELECT id, image_base64, category, material_inference, season FROM wardrobe_items ORDER BY created_at DESC")
+    cur.execute("""
+        SELECT id, image_base64, category, material_inference, season
+        FROM wardrobe_items
+        WHERE user_id = %s
+        ORDER BY created_at DESC
+    """, (user_id,))
     items = cur.fetchall()
     cur.close()
     conn.close()
@@ -117,12 +226,31 @@ def index():
 # --- HARDWARE API ---
 @app.route('/api/ingest', methods=['POST'])
 def ingest_hardware_data():
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Missing or invalid access token"}), 401
     if 'image' not in request.files:
         return jsonify({"error": "No image part"}), 400
         
     file = request.files['image']
     tactile_raw = request.form.get('tactile_json', '{}')
     tactile_data = json.loads(tactile_raw)
+
+    # Optional raw sensor stream: features are computed here instead of on the rig
+    tactile_features = None
+    if 'tactile_raw' in request.files:
+        try:
+            samples = parse_tactile_samples(
+                request.files['tactile_raw'].read(),
+                dtype=request.form.get('tactile_dtype', 'float32'),
+                channels=int(request.form.get('tactile_channels', 2))
+            )
+            tactile_features = extract_tactile_features(samples, float(request.form.get('tactile_sample_rate', 1000)))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid tactile payload: {e}"}), 400
+        tactile_data['roughness'] = tactile_features['roughness']
+        if tactile_features['stiffness'] is not None:
+            tactile_data['stiffness'] = tactile_features['stiffness']
     
     # 1. Read Bytes
     image_bytes = file.read()
@@ -138,14 +266,17 @@ def ingest_hardware_data():
     visual_vec, semantic_vec = generate_embeddings(image_bytes, semantic_text)
     
     # 4. Storage (AlloyDB)
+    # tactile_embedding is a vector(8) column (NULL for items ingested without raw samples)
     conn = get_db_connection()
     cur = conn.cursor()
+    ensure_user_partition(cur, user_id)
     cur.execute("""
         INSERT INTO wardrobe_items 
-        (image_base64, tactile_roughness, tactile_stiffness, category, color, material_inference, brand, season, visual_embedding, semantic_embedding)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        (user_id, image_base64, tactile_roughness, tactile_stiffness, category, color, material_inference, brand, season, visual_embedding, semantic_embedding, tactile_embedding)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id
     """, (
+        user_id,
         base64_string, # Store the giant string here
         tactile_data.get('roughness'),
         tactile_data.get('stiffness'),
@@ -155,14 +286,15 @@ def ingest_hardware_data():
         "Generic",
         metadata.get('season'),
         str(visual_vec),
-        str(semantic_vec)
+        str(semantic_vec),
+        str(tactile_features['vector']) if tactile_features else None
     ))
     new_id = cur.fetchone()[0]
     conn.commit()
     cur.close()
     conn.close()
     
-    return jsonify({"status": "success", "id": new_id, "analysis": metadata})
+    return jsonify({"status": "success", "id": new_id, "analysis": metadata, "tactile_features": tactile_features})
 
 # --- AGENT ROUTES ---
 @app.route('/api/agent/stylist', methods=['POST'])
@@ -171,58 +303,67 @@ def stylist_agent():
     The Brain: Reasons about outfit choices based on context.
     Returns structured JSON with items and explanation.
     """
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Missing or invalid access token"}), 401
     data = request.json
     context = data.get('context') 
+    # Optional: tactile feature vector of a fabric feel the user wants (e.g. copied from an ingested item)
+    tactile_vec = data.get('tactile_vector')
+    if tactile_vec is not None:
+        try:
+            tactile_vec = parse_tactile_vector(tactile_vec)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
     
-    # 1. Retrieve Candidate items using Semantic Search (Text-to-Text)
-    # The semantic vector already captures the "vibe", so the search results are already relevant.
+    # 1. Retrieve Candidate items using Hybrid Search
+    # Structured hints (season, formality, needed categories) come from the context;
+    # the semantic vector then ranks items within each category.
+    hints = parse_context_hints(context)
     text_emb_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-    embeddings = text_emb_model.get_embeddings([context])
+    embeddings = text_emb_model.get_embeddings([f"{context} ({hints['formality']} style)"])
     query_vec = embeddings[0].values
     
     conn = get_db_connection()
     cur = conn.cursor()
-    # FIXED SQL: Removed 'vibe_description' column from SELECT
-    cur.execute("""
-        SELECT id, category, material_inference, color, season 
-        FROM wardrobe_items 
-        ORDER BY semantic_embedding <=> %s::vector 
-        LIMIT 10
-    """, (str(query_vec),))
-    candidates = cur.fetchall()
+    candidates = retrieve_balanced_candidates(cur, user_id, query_vec, hints, tactile_vec=tactile_vec)
     
     if not candidates:
          cur.close()
          conn.close()
          return jsonify({"explanation": "No suitable items found in wardrobe.", "items": []})
 
-    # Format candidates for LLM
-    candidate_str = ""
+    # Format candidates for LLM. Rows are ordered by rank within their group, so trimming
+    # to the token budget drops each group's weakest items first and keeps the set balanced.
+    group_counts = {}
+    ranked_candidates = []
     for c in candidates:
-        # FIXED PYTHON: Removed reference to non-existent vibe column (c[5])
-        # We construct a factual description from available columns.
-        candidate_str += f"- ID {c[0]}: {c[3]} {c[1]} (Material: {c[2]}, Season: {c[4]})\n"
-    
+        group_counts[c[5]] = group_counts.get(c[5], 0) + 1
+        ranked_candidates.append((group_counts[c[5]], {
+            "id": c[0], "group": c[5], "category": c[1], "color": c[3],
+            "material": c[2], "season": c[4]
+        }))
+    ranked_candidates = [c for _, c in sorted(ranked_candidates, key=lambda rc: rc[0])]
+
     # 2. Agent Reasoning (Gemini Pro)
-    prompt = f"""
-    You are an expert fashion stylist. 
-    User Context/Request: "{context}"
-    
-    Available Wardrobe Candidates (pre-filtered by relevance):
-    {candidate_str}
-    
-    Task: Select the best 2-3 items from the list above to create a complete outfit for the context.
-    
-    Output Requirement: You MUST return ONLY raw JSON with this exact structure:
-    {{
-        "explanation": "A short, friendly stylist note explaining why these items work together for the context.",
-        "item_ids": [id1, id2] 
-    }}
-    Do not use markdown block quotes. Just the raw JSON string.
-    """
+    model, prefix_cached = get_instruction_model(
+        "stylist", BRAIN_MODEL_NAME, STYLIST_INSTRUCTIONS, USE_VERTEX_CONTEXT_CACHE)
+    request_text = f"""User Context/Request: "{context}"
+Target formality: {hints['formality']}
+Wardrobe candidates:"""
+    prompt, _, prompt_stats = build_prompt(
+        request_text,
+        ranked_candidates,
+        ["id", "group", "category", "color", "material", "season"],
+        PROMPT_TOKEN_BUDGET,
+        prefix_tokens=estimate_tokens(STYLIST_INSTRUCTIONS),
+        baseline_encoder=encode_stylist_lines
+    )
+    prompt_stats["prefix_cached"] = prefix_cached
+    print(f"Stylist prompt: {prompt_stats}")
     
     try:
-        response = model_brain.generate_content(
+        response = model.generate_content(
             prompt, 
             generation_config={"temperature": 0.3}
         )
@@ -245,8 +386,8 @@ def stylist_agent():
         cur.execute(f"""
             SELECT id, image_base64, category, material_inference, color
             FROM wardrobe_items
-            WHERE id IN %s
-        """, (clean_ids,))
+            WHERE user_id = %s AND id IN %s
+        """, (user_id, clean_ids))
         
         final_items_raw = cur.fetchall()
         
@@ -263,14 +404,15 @@ def stylist_agent():
         cur.close()
         conn.close()
         
-        return jsonify({"explanation": explanation, "items": final_items})
+        return jsonify({"explanation": explanation, "items": final_items, "prompt_stats": prompt_stats})
 
     except Exception as e:
         print(f"Error in stylist agent: {e}")
         if 'cur' in locals() and cur: cur.close()
         if 'conn' in locals() and conn: conn.close()
-        # Return a structured error response that the frontend can handle gracefully
-        return jsonify({"explanation": f"I had trouble creating an outfit right now. (Technical error: {str(e)})", "items": []})
+        # Return a structured error response that the frontend can handle gracefully;
+        # the status and "error" flag let clients (e.g. the Raspberry Pi) retry it later
+        return jsonify({"explanation": f"I had trouble creating an outfit right now. (Technical error: {str(e)})", "items": [], "error": True}), 502
 
 
 @app.route('/api/agent/visual-match', methods=['POST'])
@@ -279,6 +421,9 @@ def visual_matcher_agent():
     Visual Matcher (Complementary Mode): 
     Uses Gemini to find items that stylistically complete an outfit with the uploaded item.
     """
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Missing or invalid access token"}), 401
     if 'image' not in request.files:
         return jsonify({"error": "No image uploaded"}), 400
         
@@ -286,15 +431,18 @@ def visual_matcher_agent():
     # Read bytes into memory. We need them twice: once for Gemini, once for DB (optional)
     input_image_bytes = file.read()
 
-    # 1. Fetch Candidates from Database (Limit 25 for speed)
+    # 1. Fetch Candidates from Database (Limit 25 for speed), closest to the uploaded
+    # item first by visual embedding (served by the partition's HNSW index)
+    input_visual_vec, _ = generate_embeddings(input_image_bytes)
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("""
         SELECT id, category, color, material_inference, season, image_base64
         FROM wardrobe_items 
-        ORDER BY created_at DESC
+        WHERE user_id = %s
+        ORDER BY visual_embedding <=> %s::vector
         LIMIT 25
-    """)
+    """, (user_id, str(input_visual_vec)))
     candidates_raw = cur.fetchall()
     cur.close()
     conn.close()
@@ -302,7 +450,7 @@ def visual_matcher_agent():
     if not candidates_raw:
          return jsonify({"matches": [], "reasoning": "Inventory is empty."})
 
-    # Format candidates for LLM
+    # Format candidates for LLM (most related first, so trimming to the budget drops the least related)
     candidate_list_for_llm = []
     candidates_map = {} 
     for c in candidates_raw:
@@ -316,32 +464,24 @@ def visual_matcher_agent():
             "material": c[3], "image_base64": c[5]
         }
 
-    candidates_str = json.dumps(candidate_list_for_llm, indent=2)
-
     # 2. The Brain: Ask Gemini to act as a stylist
-    prompt_text = f"""
-    You are an expert fashion stylist.
-    
-    Task: Create a complete outfit.
-    1. Look at the input image provided (this is the item the user wants to wear).
-    2. Look at the following inventory list from their closet:
-    {candidates_str}
-
-    3. Select exactly 3 distinct items from the inventory list that best complement the input image to create a stylish, complete outfit. 
-    Exclude items that are too similar to the input (e.g., if input is shoes, don't pick other shoes).
-     If input is a top, do not pick another top unless it is a blazer or a cardigan or part of an ensemble.
-
-    If input is a bottom, do not pick another bottom unless it is part of an ensemble.
-
-    Output Requirement:
-    Return ONLY a raw JSON list of the 3 selected item IDs. Do not use markdown formatting.
-    Example format: [15, 4, 22]
-    """
+    model, prefix_cached = get_instruction_model(
+        "visual_match", BRAIN_MODEL_NAME, VISUAL_MATCH_INSTRUCTIONS, USE_VERTEX_CONTEXT_CACHE)
+    prompt_text, _, prompt_stats = build_prompt(
+        "Inventory:",
+        candidate_list_for_llm,
+        ["id", "category", "color", "material", "season"],
+        PROMPT_TOKEN_BUDGET,
+        prefix_tokens=estimate_tokens(VISUAL_MATCH_INSTRUCTIONS),
+        baseline_encoder=encode_json_indented
+    )
+    prompt_stats["prefix_cached"] = prefix_cached
+    print(f"Visual matcher prompt: {prompt_stats}")
 
     image_part = Part.from_data(data=input_image_bytes, mime_type="image/jpeg")
     
     try:
-        response = model_brain.generate_content(
+        response = model.generate_content(
             [image_part, prompt_text],
             generation_config={"temperature": 0.4} 
         )
@@ -379,7 +519,7 @@ def visual_matcher_agent():
             except ValueError:
                  continue # Skip if LLM returned a non-integer ID
         
-        return jsonify({"matches": final_matches[:3]})
+        return jsonify({"matches": final_matches[:3], "prompt_stats": prompt_stats})
 
     except Exception as e:
         print(f"Error in visual matcher agent: {e}")
@@ -387,5 +527,13 @@ def visual_matcher_agent():
         return jsonify({"matches": [], "error": str(e)})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # python app.py add-user <user_id>  -> registers a household (or rotates its token) and prints the token
+    if len(sys.argv) == 3 and sys.argv[1] == 'add-user':
+        conn = get_db_connection()
+        cur = conn.cursor()
+        print(create_user(cur, sys.argv[2]))
+        cur.close()
+        conn.close()
+    else:
+        app.run(host='0.0.0.0', port=5000, debug=True)
     
\ No newline at end of file
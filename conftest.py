@@ -0,0 +1,3 @@
+# Makes the service modules importable from tests/ when pytest runs from the repo root.
+# The Raspberry Pi client is a separate app with its own tests; run them from its folder.
+collect_ignore = ["raspberry-pi"]
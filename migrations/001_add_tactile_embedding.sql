@@ -0,0 +1,5 @@
+-- Raw tactile ingestion: /api/ingest stores the 8-value tactile feature vector
+-- for every item (NULL when the rig sent no raw samples).
+-- Run once against the existing wardrobe_items table.
+
+ALTER TABLE wardrobe_items ADD COLUMN IF NOT EXISTS tactile_embedding vector(8);
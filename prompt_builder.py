@@ -0,0 +1,174 @@
+import datetime
+import json
+import math
+import re
+from collections import Counter
+
+try:
+    # Context caching (CachedContent, from_cached_content) lives in the preview namespace
+    from vertexai.preview import caching
+    from vertexai.preview.generative_models import GenerativeModel
+except ImportError:
+    # Lets the encoding helpers be used (and tested) without the Vertex SDK
+    caching = None
+    GenerativeModel = None
+
+# --- CONFIGURATION ---
+# Vertex rejects context caches below a minimum size (2,048 tokens for Gemini 2.5
+# Flash at the time of writing). Shorter prefixes are not sent to the cache API at all.
+CONTEXT_CACHE_MIN_TOKENS = 2048
+# Vertex context caches expire server-side; refresh a little before the TTL ends
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+CONTEXT_CACHE_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# After a failed cache creation, use the local prefix for a while and then try Vertex again
+CONTEXT_CACHE_RETRY = datetime.timedelta(minutes=10)
+# Values shorter than this are cheaper to repeat than to put in the legend
+MIN_LEGEND_VALUE_LENGTH = 4
+
+# key -> (model, expires_at or None, is_vertex_cache)
+_instruction_models = {}
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Conservative local estimate of the Gemini token count of a prompt string.
+    Every punctuation mark and digit run counts as one token and words count
+    one token per 4 letters, so dense tables such as "@1|@2" are not
+    underestimated. It is an estimate; pass count_tokens to build_prompt for exact counts.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+def encode_candidates(candidates, fields):
+    """
+    Encodes a list of candidate dicts as a compact pipe-separated table.
+    Repeated long values (e.g. "Cotton blend", "Spring/Fall") are replaced by
+    short codes (@1, @2, ...) defined once in a legend above the table.
+    """
+    counts = Counter()
+    for c in candidates:
+        for f in fields:
+            value = c.get(f)
+            if isinstance(value, str) and len(value) >= MIN_LEGEND_VALUE_LENGTH:
+                counts[value] += 1
+
+    legend = {}
+    for value, count in counts.most_common():
+        if count > 1:
+            legend[value] = f"@{len(legend) + 1}"
+
+    def cell(value):
+        if value is None:
+            return ""
+        value = str(value).replace("|", "/").replace("\n", " ")
+        return legend.get(value, value)
+
+    lines = []
+    if legend:
+        lines.append("Legend: " + "; ".join(f"{code}={value}" for value, code in legend.items()))
+    lines.append("|".join(fields))
+    for c in candidates:
+        lines.append("|".join(cell(c.get(f)) for f in fields))
+    return "\n".join(lines)
+
+
+def encode_json_indented(candidates, fields):
+    """
+    The indented JSON encoding the visual matcher used before compaction.
+    """
+    return json.dumps([{f: c.get(f) for f in fields} for c in candidates], indent=2)
+
+
+def build_prompt(dynamic_text, candidates, fields, budget, prefix_tokens=0,
+                 baseline_encoder=encode_json_indented, count_tokens=estimate_tokens):
+    """
+    Builds the per-request part of a prompt: dynamic_text followed by the
+    candidate table (see encode_candidates). Candidates must be ordered by
+    relevance (best first); the least relevant are dropped until the prompt
+    fits in `budget` tokens (prefix_tokens is the static instruction prefix,
+    counted against the budget). At least one candidate is always kept.
+
+    baseline_encoder(candidates, fields) is the agent's previous encoding; it is
+    only used to report how much the compact table saves. Savings from the
+    encoding and from trimming are reported separately.
+    Returns (prompt_text, kept_candidates, stats).
+    """
+    def prompt_for(kept):
+        return f"{dynamic_text}\n{encode_candidates(kept, fields)}"
+
+    full_tokens = count_tokens(prompt_for(candidates)) + prefix_tokens
+    kept = list(candidates)
+    tokens = full_tokens
+    while tokens > budget and len(kept) > 1:
+        # Drop roughly as many candidates as needed to close the gap, at least one
+        per_candidate = max(1, count_tokens(encode_candidates(kept, fields)) // len(kept))
+        drop = max(1, (tokens - budget) // per_candidate)
+        kept = kept[:max(1, len(kept) - drop)]
+        tokens = count_tokens(prompt_for(kept)) + prefix_tokens
+
+    baseline_tokens = count_tokens(f"{dynamic_text}\n{baseline_encoder(candidates, fields)}") + prefix_tokens
+
+    stats = {
+        "prompt_tokens": tokens,
+        "token_count": "estimated" if count_tokens is estimate_tokens else "exact",
+        "baseline_tokens": baseline_tokens,
+        "compaction_saved_tokens": baseline_tokens - full_tokens,
+        "trimmed_tokens": full_tokens - tokens,
+        "candidates_kept": len(kept),
+        "candidates_dropped": len(candidates) - len(kept),
+        "budget": budget,
+    }
+    return prompt_for(kept), kept, stats
+
+
+def get_instruction_model(key, model_name, instructions, use_vertex_cache=True, prefix_tokens=None):
+    """
+    Returns a model that carries the static instruction prefix, so only the
+    per-request text is built and sent with each call.
+    The prefix goes into a Vertex AI context cache only when it is at least
+    CONTEXT_CACHE_MIN_TOKENS long (prefix_tokens, estimated if not given).
+    Otherwise, or if the cache cannot be created, the local stand-in is used:
+    a model built once with the instructions as its system instruction. The
+    stand-in is billed as normal input tokens. After a failure, Vertex is
+    tried again after CONTEXT_CACHE_RETRY.
+    Returns (model, is_vertex_cache).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cached = _instruction_models.get(key)
+    if cached:
+        model, expires_at, is_vertex = cached
+        refresh_at = expires_at - CONTEXT_CACHE_REFRESH_MARGIN if is_vertex else expires_at
+        if refresh_at is None or now < refresh_at:
+            return model, is_vertex
+
+    if prefix_tokens is None:
+        prefix_tokens = estimate_tokens(instructions)
+    cacheable = use_vertex_cache and caching is not None and prefix_tokens >= CONTEXT_CACHE_MIN_TOKENS
+
+    retry_at = None
+    if cacheable:
+        cached_content = None
+        try:
+            cached_content = caching.CachedContent.create(
+                model_name=model_name,
+                system_instruction=instructions,
+                ttl=CONTEXT_CACHE_TTL,
+            )
+            model = GenerativeModel.from_cached_content(cached_content=cached_content)
+            _instruction_models[key] = (model, now + CONTEXT_CACHE_TTL, True)
+            return model, True
+        except Exception as e:
+            print(f"Context cache unavailable for '{key}', using local instruction prefix: {e}")
+            if cached_content is not None:
+                # Do not leave an unused (billed) cache behind
+                try:
+                    cached_content.delete()
+                except Exception as delete_error:
+                    print(f"Could not delete context cache for '{key}': {delete_error}")
+            retry_at = now + CONTEXT_CACHE_RETRY
+
+    model = GenerativeModel(model_name, system_instruction=instructions)
+    _instruction_models[key] = (model, retry_at, False)
+    return model, False
@@ -1,22 +1,271 @@
 from flask import Flask, render_template, Response, stream_with_context
+from flask.helpers import get_debug_flag
 from dotenv import load_dotenv
+import datetime
+import hashlib
 import json
+import threading
 import time
 
 # Import services
-from services.calendar_service import get_todays_events
+from services.calendar_service import get_events_for_day
 from services.gemini_service import get_stylist_recommendation
+from services.weather_service import get_weather_data, format_weather, weather_changed_significantly
 import os
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# --- PRE-GENERATION CONFIGURATION ---
+
+def parse_pregenerate_times(value):
+    """
+    Parses a comma separated list of HH:MM times into sorted datetime.time values.
+    Raises ValueError on anything that is not a valid time of day.
+    """
+    times = []
+    for raw in value.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            times.append(datetime.datetime.strptime(raw, "%H:%M").time())
+        except ValueError:
+            raise ValueError(f"Invalid PREGENERATE_TIMES entry '{raw}', expected HH:MM (e.g. 06:00)")
+    return sorted(times)
+
+# Times of day (HH:MM, comma separated) at which today's and tomorrow's outfits are fully refreshed
+PREGENERATE_TIMES = parse_pregenerate_times(os.getenv("PREGENERATE_TIMES", "06:00,18:00"))
+# How often (minutes) to poll the calendar for changes between scheduled runs
+CALENDAR_POLL_MINUTES = int(os.getenv("CALENDAR_POLL_MINUTES", "15"))
+# How many days ahead to pre-generate (1 = today only, 2 = today and tomorrow)
+PREGENERATE_DAYS = int(os.getenv("PREGENERATE_DAYS", "2"))
+# Minimum temperature swing (°C) that counts as a significant weather change
+WEATHER_TEMP_THRESHOLD = float(os.getenv("WEATHER_TEMP_THRESHOLD", "3"))
+# Where the pre-computed outfits are kept between restarts
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.json")
+# Set to false to only generate outfits on demand (the button), e.g. in tests
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() == "true"
+
+GENERAL_EVENT_KEY = "__general__"
+
+_snapshot = {}
+_snapshot_lock = threading.Lock()
+# Only one generation run (scheduler or button) may call the stylist at a time
+_generation_lock = threading.Lock()
+
+# --- SNAPSHOT HELPERS ---
+
+def load_snapshot():
+    global _snapshot
+    if os.path.exists(SNAPSHOT_PATH):
+        try:
+            with open(SNAPSHOT_PATH) as f:
+                _snapshot = json.load(f)
+        except Exception as e:
+            print(f"Could not read snapshot {SNAPSHOT_PATH}: {e}")
+            _snapshot = {}
+
+def save_day_snapshot(day, day_snapshot):
+    """
+    Stores the snapshot for one day and drops days that are already in the past.
+    """
+    today = datetime.date.today().isoformat()
+    with _snapshot_lock:
+        _snapshot[day] = day_snapshot
+        for old_day in [d for d in _snapshot if d < today]:
+            del _snapshot[old_day]
+        try:
+            with open(SNAPSHOT_PATH, "w") as f:
+                json.dump(_snapshot, f)
+        except Exception as e:
+            print(f"Could not write snapshot {SNAPSHOT_PATH}: {e}")
+
+def get_day_snapshot(day_offset=0):
+    day = (datetime.date.today() + datetime.timedelta(days=day_offset)).isoformat()
+    with _snapshot_lock:
+        return _snapshot.get(day)
+
+def event_key(event):
+    # Calendar ids are stable across edits; fall back to the title and time for events without one
+    return event.get("id") or f"{event['summary']}|{event['start']}"
+
+def outfit_failed(entry):
+    # Outfits from failed stylist calls are stored so the page has something to show,
+    # but they are never reused as if they were real recommendations
+    return bool(entry["outfit"].get("error"))
+
+def snapshot_has_errors(day_snapshot):
+    return any(outfit_failed(entry) for entry in day_snapshot["entries"].values())
+
+def event_fingerprint(event):
+    raw = json.dumps([event.get("summary"), event.get("start"), event.get("location"), event.get("description")])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# --- PRE-GENERATION ---
+
+def refresh_day(day_offset=0, check_weather=True):
+    """
+    Re-styles the events of one day and stores the result in the snapshot.
+    Events are only sent to the stylist again if they are new, were edited,
+    their previous styling failed, or (when check_weather is set) their
+    weather changed significantly.
+    Yields progress dicts in the same shape the SSE route sends.
+    """
+    day = (datetime.date.today() + datetime.timedelta(days=day_offset)).isoformat()
+    previous = get_day_snapshot(day_offset) or {}
+    previous_entries = previous.get("entries", {})
+
+    yield {"status": "📅 Connecting to Google Calendar...", "progress": 10}
+    events = get_events_for_day(day_offset)
+    yield {"status": f"Found {len(events)} events for today.", "progress": 25}
+
+    if not events:
+        yield {"status": "No events found, but checking for a general recommendation...", "progress": 50}
+        # Create a dummy event for general advice
+        dummy_event = {"id": GENERAL_EVENT_KEY, "summary": "General Day", "start": "Today", "location": "", "description": "Just a regular day"}
+        styled_events = [dummy_event]
+    else:
+        styled_events = events
+
+    entries = {}
+    processed_outfits = []
+    restyled = 0
+    for i, event in enumerate(styled_events):
+        key = event_key(event)
+        fingerprint = event_fingerprint(event)
+        prev = previous_entries.get(key)
+        unchanged = prev is not None and prev["fingerprint"] == fingerprint
+
+        weather = prev["weather"] if unchanged else None
+        if event.get("location") and (check_weather or not unchanged):
+            # Keep the last known forecast if the weather API is temporarily unreachable
+            weather = get_weather_data(event["location"], day_offset) or weather
+
+        reusable = unchanged and not outfit_failed(prev)
+        if reusable and not weather_changed_significantly(prev["weather"], weather, WEATHER_TEMP_THRESHOLD):
+            outfit = prev["outfit"]
+        else:
+            progress = 25 + int((i / len(styled_events)) * 70)
+            yield {"status": f"✨ Styling for '{event['summary']}'...", "progress": progress}
+            weather_str = format_weather(event["location"], weather) if event.get("location") else None
+            outfit = get_stylist_recommendation(event, index=i, weather=weather_str)
+            restyled += 1
+
+        entries[key] = {"fingerprint": fingerprint, "weather": weather, "outfit": outfit}
+        processed_outfits.append(outfit)
+
+    day_snapshot = {
+        "date": day,
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "events": events,
+        "outfits": processed_outfits,
+        "entries": entries
+    }
+    save_day_snapshot(day, day_snapshot)
+    print(f"Snapshot for {day} refreshed ({restyled}/{len(styled_events)} events re-styled).")
+    yield {"status": "All Done!", "progress": 100, "complete": True, "events": events, "outfits": processed_outfits}
+
+def run_refresh(day_offset=0, check_weather=True):
+    """
+    Runs refresh_day to completion, for callers that do not stream progress.
+    """
+    with _generation_lock:
+        for _ in refresh_day(day_offset, check_weather):
+            pass
+
+def calendar_changed(day_offset):
+    """
+    True if the calendar for that day no longer matches the stored snapshot,
+    or the snapshot still has outfits whose styling failed.
+    """
+    day_snapshot = get_day_snapshot(day_offset)
+    if not day_snapshot or snapshot_has_errors(day_snapshot):
+        return True
+    events = get_events_for_day(day_offset)
+    current = {event_key(e): event_fingerprint(e) for e in events}
+    stored = {key: entry["fingerprint"] for key, entry in day_snapshot["entries"].items() if key != GENERAL_EVENT_KEY}
+    return current != stored
+
+def latest_scheduled_time(now, times=None):
+    """
+    Returns the most recent scheduled refresh (a datetime) at or before now,
+    looking back into yesterday if none of today's times has passed yet.
+    """
+    times = PREGENERATE_TIMES if times is None else times
+    if not times:
+        return None
+    for day in (now.date(), now.date() - datetime.timedelta(days=1)):
+        passed = [datetime.datetime.combine(day, t) for t in times if datetime.datetime.combine(day, t) <= now]
+        if passed:
+            return passed[-1]
+    return None
+
+def scheduler_loop():
+    """
+    Background thread: full refresh (calendar + weather) at each PREGENERATE_TIMES,
+    and a calendar-only check every CALENDAR_POLL_MINUTES in between.
+    A scheduled time that passes while a refresh is blocked or running is
+    picked up on the next tick rather than skipped.
+    """
+    last_full_refresh = datetime.datetime.now()
+    last_poll = 0
+    while True:
+        now = datetime.datetime.now()
+        due = latest_scheduled_time(now)
+        try:
+            if due and due > last_full_refresh:
+                last_full_refresh = now
+                for day_offset in range(PREGENERATE_DAYS):
+                    run_refresh(day_offset, check_weather=True)
+                last_poll = time.time()
+            elif time.time() - last_poll >= CALENDAR_POLL_MINUTES * 60:
+                last_poll = time.time()
+                for day_offset in range(PREGENERATE_DAYS):
+                    if calendar_changed(day_offset):
+                        run_refresh(day_offset, check_weather=False)
+        except Exception as e:
+            print(f"Scheduler error: {e}")
+        time.sleep(20)
+
+def scheduler_should_start(use_reloader):
+    """
+    True in the process that serves requests. With the debug reloader the app
+    is loaded twice, by a file watcher and by the serving child process
+    (WERKZEUG_RUN_MAIN=true); only the child runs the scheduler.
+    """
+    if not RUN_SCHEDULER:
+        print("RUN_SCHEDULER is false; outfits are only generated on demand.")
+        return False
+    return not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+def start_scheduler():
+    load_snapshot()
+    thread = threading.Thread(target=scheduler_loop, name="wardrobe-scheduler", daemon=True)
+    thread.start()
+    print(f"Pre-generation scheduler started (full refresh at {', '.join(t.strftime('%H:%M') for t in PREGENERATE_TIMES)}).")
+
+# --- ROUTES ---
+
 @app.route('/')
 def index():
-    # Render the page with just the button initially. 
-    # State flags in template will handle visibility (or we assume 'events' is None initially)
-    return render_template('index.html', events=None)
+    # Serve today's pre-generated outfits straight away if the scheduler has them,
+    # otherwise render the page with just the button (which also retries failed events).
+    day_snapshot = get_day_snapshot(0)
+    snapshot = None
+    if day_snapshot and not snapshot_has_errors(day_snapshot):
+        snapshot = {"events": day_snapshot["events"], "outfits": day_snapshot["outfits"]}
+    return render_template('index.html', events=None, snapshot=snapshot)
+
+def snapshot_message(day_snapshot):
+    return {
+        "status": "All Done!",
+        "progress": 100,
+        "complete": True,
+        "events": day_snapshot["events"],
+        "outfits": day_snapshot["outfits"]
+    }
 
 @app.route('/stream_wardrobe_generation')
 def stream_wardrobe_generation():
@@ -26,44 +275,33 @@ def stream_wardrobe_generation():
             return f"data: {json.dumps(data)}\n\n"
 
         try:
-            # Step 1: Calendar
-            yield sse({"status": "📅 Connecting to Google Calendar...", "progress": 10})
-            events = get_todays_events()
-            yield sse({"status": f"Found {len(events)} events for today.", "progress": 25})
-            
-            # Step 2: Stylist API (Loop through each event)
-            processed_outfits = []
-            total_events = len(events)
-            
-            if total_events == 0:
-                # Handle no events case
-                yield sse({"status": "No events found, but checking for a general recommendation...", "progress": 50})
-                # Create a dummy event for general advice
-                dummy_event = {"summary": "General Day", "start": "Today", "location": "", "description": "Just a regular day"}
-                outfit = get_stylist_recommendation(dummy_event, index=0)
-                processed_outfits.append(outfit)
-            else:
-                for i, event in enumerate(events):
-                    progress = 25 + int((i / total_events) * 70)
-                    yield sse({"status": f"✨ Styling for '{event['summary']}'...", "progress": progress})
-                    
-                    outfit = get_stylist_recommendation(event, index=i)
-                    processed_outfits.append(outfit)
-            
-            # Finish
-            yield sse({
-                "status": "All Done!", 
-                "progress": 100, 
-                "complete": True, 
-                "events": events, 
-                "outfits": processed_outfits
-            })
-            
+            day_snapshot = get_day_snapshot(0)
+            if day_snapshot and not snapshot_has_errors(day_snapshot):
+                yield sse(snapshot_message(day_snapshot))
+                return
+
+            # No usable snapshot yet (first start, or some events failed to style):
+            # run the pipeline now and stream its progress. Only missing or failed events are re-styled.
+            with _generation_lock:
+                # The scheduler may have finished today's run while we waited for the lock
+                day_snapshot = get_day_snapshot(0)
+                if day_snapshot and not snapshot_has_errors(day_snapshot):
+                    yield sse(snapshot_message(day_snapshot))
+                    return
+                for message in refresh_day(0):
+                    yield sse(message)
+
         except Exception as e:
             yield sse({"error": str(e)})
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 if __name__ == '__main__':
+    # debug=True below turns on the reloader
+    if scheduler_should_start(use_reloader=True):
+        start_scheduler()
     # Host 0.0.0.0 is important for Raspberry Pi to be accessible from other devices
     app.run(debug=True, host='0.0.0.0', port=5000)
+elif scheduler_should_start(use_reloader=get_debug_flag()):
+    # flask run, gunicorn or a systemd unit import the app without running the block above
+    start_scheduler()
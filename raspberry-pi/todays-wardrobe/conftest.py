@@ -0,0 +1,5 @@
+# Makes `app` and `services` importable from tests/ when pytest runs from this folder.
+import os
+
+# Importing app must not start the background scheduler during tests
+os.environ.setdefault("RUN_SCHEDULER", "false")
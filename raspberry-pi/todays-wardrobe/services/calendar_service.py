@@ -58,11 +58,18 @@ def get_todays_events():
     """Shows basic usage of the Google Calendar API.
     Prints the start and name of the next 10 events on the user's calendar.
     """
+    return get_events_for_day(0)
+
+def get_events_for_day(day_offset=0):
+    """
+    Fetches the events for a single day, relative to today
+    (0 = today, 1 = tomorrow).
+    """
     service = get_calendar_service()
     if not service:
         return []
 
-    now = datetime.datetime.now()
+    now = datetime.datetime.now() + datetime.timedelta(days=day_offset)
     # Start of today (midnight)
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
     # End of today (23:59:59)
@@ -118,6 +125,7 @@ def get_todays_events():
                 description = event.get("description", "")
                 location = event.get("location", "")
                 event_list.append({
+                    "id": event.get("id"),
                     "start": formatted_time,
                     "summary": summary,
                     "description": description,
@@ -5,33 +5,67 @@ import time
 import json
 from services.weather_service import get_weather
 
-def build_event_context(event):
+def build_event_context(event, weather=None):
     """
     Builds a context string for a single event.
+    If weather is given (already fetched by the caller) it is used instead of
+    looking it up again.
     """
     weather_info = ""
     if event.get('location'):
-        weather = get_weather(event['location'])
+        if weather is None:
+            weather = get_weather(event['location'])
         weather_info = f" [Weather at {event['location']}: {weather}]"
     
     return f"Event: {event['summary']} at {event['start']}. Location: {event['location']}{weather_info}. Description: {event['description']}"
 
-def get_stylist_recommendation(event, index=0):
+def stylist_response_failed(data):
+    """
+    True if a 200 response from the Stylist API is really a failure.
+    Newer servers set "error"; older ones only return no items with a
+    "Technical error" note in the explanation.
+    """
+    if data.get("error"):
+        return True
+    return not data.get("items") and "technical error" in str(data.get("explanation", "")).lower()
+
+def get_stylist_recommendation(event, index=0, weather=None):
     """
     Calls the external stylist API for a single event.
     Returns a dict with recommendation details and image filename.
+    Failed calls return the same shape with "error": True so callers can retry them.
     """
-    context = build_event_context(event)
+    context = build_event_context(event, weather)
     url = "https://wardrobe-uxu5wi2jpa-uc.a.run.app/api/agent/stylist"
+    # The stylist service keeps a separate wardrobe per user, identified by their access token
+    token = os.getenv("WARDROBE_TOKEN")
+    if not token:
+        print("WARDROBE_TOKEN is not set; skipping Stylist API call.")
+        return {
+            "events_involved": event['summary'],
+            "recommendation": "The Stylist is not configured: set WARDROBE_TOKEN in .env.",
+            "items": [],
+            "error": True
+        }
+    headers = {"Authorization": f"Bearer {token}"}
     
     try:
         print(f"DEBUG: Calling Stylist API for event: {event['summary']}")
-        response = requests.post(url, json={"context": context}, timeout=60)
+        response = requests.post(url, json={"context": context}, headers=headers, timeout=60)
         
         if response.status_code == 200:
             data = response.json()
             print(f"DEBUG: API Response keys: {list(data.keys())}")
-            
+
+            if stylist_response_failed(data):
+                print(f"Stylist API could not style the event: {data.get('explanation')}")
+                return {
+                    "events_involved": event['summary'],
+                    "recommendation": data.get("explanation", "The Stylist could not create an outfit."),
+                    "items": [],
+                    "error": True
+                }
+
             # Extract explanation from root or use default
             explanation = data.get("explanation", data.get("context", "Here is a look for your event."))
             
@@ -76,7 +110,8 @@ def get_stylist_recommendation(event, index=0):
             return {
                 "events_involved": event['summary'],
                 "recommendation": f"Error getting advice: {response.text}",
-                "items": []
+                "items": [],
+                "error": True
             }
 
     except Exception as e:
@@ -84,7 +119,8 @@ def get_stylist_recommendation(event, index=0):
         return {
             "events_involved": event['summary'],
             "recommendation": f"Connection error: {e}",
-            "items": []
+            "items": [],
+            "error": True
         }
 
 def get_outfit_recommendation(events):
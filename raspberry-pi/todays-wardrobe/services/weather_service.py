@@ -18,23 +18,39 @@ def get_lat_long(location_name):
         print(f"Geocoding error for {location_name}: {e}")
         return None, None
 
-def get_weather(location_name):
+def get_weather(location_name, day_offset=0):
     """
     Fetches the weather forecast for today for a given location name.
     """
+    return format_weather(location_name, get_weather_data(location_name, day_offset))
+
+def format_weather(location_name, weather):
+    """
+    Turns the dict returned by get_weather_data into the string the stylist sees.
+    """
+    if not weather:
+        return f"(Weather data unavailable for '{location_name}')"
+    return f"{weather['condition']}, High: {weather['max_temp']}°C, Low: {weather['min_temp']}°C"
+
+def get_weather_data(location_name, day_offset=0):
+    """
+    Fetches the forecast for a location as a dict with condition, max_temp and
+    min_temp, or None if it could not be fetched.
+    day_offset selects the day (0 = today, 1 = tomorrow).
+    """
     lat, lon = get_lat_long(location_name)
     if not lat:
-        return f"(Weather data unavailable for '{location_name}')"
+        return None
 
     # API request to Open-Meteo
-    # We ask for max/min temp and weather code for today
+    # We ask for max/min temp and weather code for each day up to day_offset
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
         "latitude": lat,
         "longitude": lon,
         "daily": ["weather_code", "temperature_2m_max", "temperature_2m_min"],
         "timezone": "auto",
-        "forecast_days": 1
+        "forecast_days": day_offset + 1
     }
 
     try:
@@ -43,10 +59,10 @@ def get_weather(location_name):
         
         if "daily" in data:
             daily = data["daily"]
-            max_temp = daily["temperature_2m_max"][0]
-            min_temp = daily["temperature_2m_min"][0]
+            max_temp = daily["temperature_2m_max"][day_offset]
+            min_temp = daily["temperature_2m_min"][day_offset]
             # Simple WMO weather code interpretation (could be expanded)
-            code = daily.get("weather_code", [0])[0]
+            code = daily.get("weather_code", [0] * (day_offset + 1))[day_offset]
             
             # Basic WMO code map
             condition = "Clear"
@@ -56,10 +72,23 @@ def get_weather(location_name):
             elif code in [71, 73, 75, 77]: condition = "Snowy"
             elif code >= 95: condition = "Thunderstorm"
 
-            return f"{condition}, High: {max_temp}°C, Low: {min_temp}°C"
+            return {"condition": condition, "max_temp": max_temp, "min_temp": min_temp}
         
-        return "(Weather data parse error)"
+        print(f"Weather data parse error for {location_name}")
+        return None
 
     except Exception as e:
         print(f"Weather API error: {e}")
-        return "(Weather fetch failed)"
+        return None
+
+def weather_changed_significantly(old, new, temp_threshold=3.0):
+    """
+    True if the condition changed or either temperature moved by at least
+    temp_threshold degrees. A forecast appearing or disappearing counts as a change.
+    """
+    if not old or not new:
+        return bool(old) != bool(new)
+    if old["condition"] != new["condition"]:
+        return True
+    return (abs(old["max_temp"] - new["max_temp"]) >= temp_threshold or
+            abs(old["min_temp"] - new["min_temp"]) >= temp_threshold)
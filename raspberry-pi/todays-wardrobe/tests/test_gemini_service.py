@@ -0,0 +1,43 @@
+import pytest
+
+from services import gemini_service
+
+
+def test_missing_token_is_reported_as_failed(monkeypatch):
+    monkeypatch.delenv("WARDROBE_TOKEN", raising=False)
+    event = {"summary": "Work", "start": "9", "location": "", "description": ""}
+    outfit = gemini_service.get_stylist_recommendation(event)
+    assert outfit["error"] is True
+    assert outfit["items"] == []
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.mark.parametrize("data", [
+    # Current server: flags the failure explicitly
+    {"explanation": "I had trouble creating an outfit right now. (Technical error: quota)", "items": [], "error": True},
+    # Older servers answer 200 with no items and a technical-error note
+    {"explanation": "I had trouble creating an outfit right now. (Technical error: quota)", "items": []},
+])
+def test_stylist_failures_behind_200_are_reported_as_failed(monkeypatch, data):
+    monkeypatch.setenv("WARDROBE_TOKEN", "token")
+    monkeypatch.setattr(gemini_service.requests, "post", lambda *args, **kwargs: FakeResponse(data))
+    event = {"summary": "Work", "start": "9", "location": "", "description": ""}
+    outfit = gemini_service.get_stylist_recommendation(event)
+    assert outfit["error"] is True
+
+
+def test_empty_wardrobe_is_not_a_failure(monkeypatch):
+    monkeypatch.setenv("WARDROBE_TOKEN", "token")
+    data = {"explanation": "No suitable items found in wardrobe.", "items": []}
+    monkeypatch.setattr(gemini_service.requests, "post", lambda *args, **kwargs: FakeResponse(data))
+    event = {"summary": "Work", "start": "9", "location": "", "description": ""}
+    assert "error" not in gemini_service.get_stylist_recommendation(event)
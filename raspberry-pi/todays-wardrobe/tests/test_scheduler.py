@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+
+import app
+
+
+def test_parse_pregenerate_times():
+    assert app.parse_pregenerate_times(" 18:00, 06:30 ,") == [datetime.time(6, 30), datetime.time(18, 0)]
+
+
+@pytest.mark.parametrize("value", ["6am", "25:00", "06:00,noon"])
+def test_parse_pregenerate_times_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        app.parse_pregenerate_times(value)
+
+
+def test_latest_scheduled_time():
+    times = [datetime.time(6, 0), datetime.time(18, 0)]
+    day = datetime.date(2026, 10, 19)
+    at = lambda h, m=0: datetime.datetime.combine(day, datetime.time(h, m))
+
+    assert app.latest_scheduled_time(at(6, 0), times) == at(6, 0)
+    # A slot that passed while the loop was blocked is still the one that is due
+    assert app.latest_scheduled_time(at(6, 7), times) == at(6, 0)
+    assert app.latest_scheduled_time(at(19), times) == at(18)
+    assert app.latest_scheduled_time(at(5), times) == at(18) - datetime.timedelta(days=1)
+    assert app.latest_scheduled_time(at(5), []) is None
+
+
+def test_scheduler_starts_without_the_reloader(monkeypatch):
+    monkeypatch.setattr(app, "RUN_SCHEDULER", True)
+    monkeypatch.delenv("WERKZEUG_RUN_MAIN", raising=False)
+    # gunicorn, systemd or flask run without --debug
+    assert app.scheduler_should_start(use_reloader=False)
+    # Debug reloader: only its serving child runs the scheduler
+    assert not app.scheduler_should_start(use_reloader=True)
+    monkeypatch.setenv("WERKZEUG_RUN_MAIN", "true")
+    assert app.scheduler_should_start(use_reloader=True)
+
+    monkeypatch.setattr(app, "RUN_SCHEDULER", False)
+    assert not app.scheduler_should_start(use_reloader=False)
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    """
+    Replaces the calendar, weather and stylist calls with local fakes and
+    records which events were sent to the stylist.
+    """
+    state = {
+        "events": [{"id": "e1", "summary": "Work", "start": "09:00 AM - 05:00 PM", "location": "", "description": ""}],
+        "fail": False,
+        "styled": [],
+    }
+
+    def fake_stylist(event, index=0, weather=None):
+        state["styled"].append(event["summary"])
+        outfit = {"events_involved": event["summary"], "recommendation": "Look", "items": []}
+        if state["fail"]:
+            outfit.update(recommendation="Connection error: down", error=True)
+        return outfit
+
+    monkeypatch.setattr(app, "get_events_for_day", lambda day_offset=0: [dict(e) for e in state["events"]])
+    monkeypatch.setattr(app, "get_weather_data", lambda location, day_offset=0: None)
+    monkeypatch.setattr(app, "get_stylist_recommendation", fake_stylist)
+    monkeypatch.setattr(app, "SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    monkeypatch.setattr(app, "_snapshot", {})
+    return state
+
+
+def test_unchanged_events_are_not_restyled(pipeline):
+    app.run_refresh(0)
+    app.run_refresh(0)
+    assert pipeline["styled"] == ["Work"]
+    assert not app.calendar_changed(0)
+
+    pipeline["events"][0]["summary"] = "Gym"
+    assert app.calendar_changed(0)
+    app.run_refresh(0)
+    assert pipeline["styled"] == ["Work", "Gym"]
+
+
+def test_failed_outfits_are_retried(pipeline):
+    pipeline["fail"] = True
+    app.run_refresh(0)
+    assert app.snapshot_has_errors(app.get_day_snapshot(0))
+    assert app.calendar_changed(0)
+
+    pipeline["fail"] = False
+    app.run_refresh(0)
+    assert pipeline["styled"] == ["Work", "Work"]
+    assert not app.snapshot_has_errors(app.get_day_snapshot(0))
+    assert not app.calendar_changed(0)
@@ -0,0 +1,24 @@
+from services.weather_service import weather_changed_significantly
+
+
+def forecast(condition="Clear", max_temp=20.0, min_temp=10.0):
+    return {"condition": condition, "max_temp": max_temp, "min_temp": min_temp}
+
+
+def test_small_temperature_drift_is_not_significant():
+    assert not weather_changed_significantly(forecast(), forecast(max_temp=22, min_temp=9))
+
+
+def test_temperature_swing_at_threshold_is_significant():
+    assert weather_changed_significantly(forecast(), forecast(max_temp=23))
+    assert weather_changed_significantly(forecast(), forecast(min_temp=6), temp_threshold=4)
+
+
+def test_condition_change_is_significant():
+    assert weather_changed_significantly(forecast(), forecast(condition="Rainy"))
+
+
+def test_missing_forecasts():
+    assert not weather_changed_significantly(None, None)
+    assert weather_changed_significantly(None, forecast())
+    assert weather_changed_significantly(forecast(), None)
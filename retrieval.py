@@ -0,0 +1,185 @@
+import re
+
+from tactile import TACTILE_MAX_DISTANCE, TACTILE_WEIGHT
+
+# --- CONFIGURATION ---
+# How many candidates the stylist sees per clothing category
+CANDIDATES_PER_CATEGORY = 3
+# Nearest neighbours fetched per category through the ANN index before they
+# are re-ranked by season and tactile similarity
+ANN_POOL_PER_CATEGORY = 12
+# HNSW candidate list size for retrieval queries. The category filter is applied
+# to the rows the index scan returns, so the scan is also made iterative (see
+# retrieve_balanced_candidates); requires pgvector 0.8 or later.
+HNSW_EF_SEARCH = 100
+
+# Category groups used to balance candidate sets. Gemini writes free-form
+# categories at ingest time, so each group lists the words (regexes) that name it.
+# They are matched as whole words, so "Swimsuit" is not a suit and "Petticoat" not a coat.
+CATEGORY_GROUPS = {
+    "top": ["tops?", "t-?shirts?", "tees?", "shirts?", "overshirts?", "sweatshirts?", "blouses?", "sweaters?",
+            "jumpers?", "pullovers?", "polos?", "hoodies?", "cardigans?", "turtlenecks?", "camisoles?"],
+    "bottom": ["pants", "trousers", "jeans", "skirts?", "shorts", "chinos", "leggings", "joggers", "sweatpants"],
+    "dress": ["dress(?:es)?", "jumpsuits?", "rompers?", "suits?", "gowns?"],
+    "outerwear": ["jackets?", "coats?", "overcoats?", "raincoats?", "trench(?:coats?)?", "blazers?", "parkas?",
+                  "anoraks?", "windbreakers?", "outerwear"],
+    "footwear": ["shoes?", "boots?", "sneakers?", "trainers?", "sandals?", "heels", "pumps", "loafers?", "flats",
+                 "footwear"],
+    "accessory": ["accessory", "accessories", "bags?", "handbags?", "backpacks?", "scarf", "scarves", "hats?", "caps?",
+                  "beanies?", "belts?", "watch(?:es)?", "jewel(?:le)?ry", "necklaces?", "earrings?", "bracelets?",
+                  "sunglasses", "ties?"],
+}
+
+
+def _whole_words(words):
+    # Postgres regex (~*) matching any of the words; \m and \M are word boundaries
+    return r"\m(?:" + "|".join(words) + r")\M"
+
+
+def category_group_patterns(group):
+    """
+    Returns (match, overridden) Postgres regexes for a category group.
+    A category belongs to the group named by its last group word (the head
+    noun): it matches `match` but not `overridden`, which is a word of this
+    group followed later by a word of another group. So "Shirt dress" is a
+    dress, "Dress shirt" a top, "Jean jacket" outerwear and "Boot-cut jeans"
+    a bottom, and every item falls in at most one group.
+    """
+    words = CATEGORY_GROUPS[group]
+    other_words = [w for g, ws in CATEGORY_GROUPS.items() if g != group for w in ws]
+    return _whole_words(words), f"{_whole_words(words)}.*{_whole_words(other_words)}"
+
+
+# Season matching runs in Postgres with case-insensitive regexes (~*);
+# \m and \M are Postgres word boundaries, so "Fall" never counts as "all season".
+ALL_SEASON_PATTERNS = [r"\mall[- ]?seasons?\M", r"\myear[- ]?round\M", r"\mall[- ]?year\M"]
+SEASON_PATTERNS = {
+    "summer": [r"\msummer\M", r"\mspring\M"] + ALL_SEASON_PATTERNS,
+    "winter": [r"\mwinter\M", r"\mfall\M", r"\mautumn\M"] + ALL_SEASON_PATTERNS,
+    "transitional": [r"\mspring\M", r"\mfall\M", r"\mautumn\M"] + ALL_SEASON_PATTERNS,
+}
+
+# Whole-word keyword rules for the context text. Athletic is checked first so
+# "workout" or "gym after work" is not read as an office event.
+FORMALITY_RULES = [
+    ("athletic", r"\b(?:gym|run|runs|running|jog|jogging|yoga|workouts?|work out|hike|hiking|training|pilates|tennis)\b"),
+    ("formal", r"\b(?:interviews?|weddings?|gala|formal|board meeting|clients?|presentations?|conferences?)\b"),
+    ("smart casual", r"\b(?:meetings?|office|work|dinner|date)\b"),
+]
+COLD_OR_WET_PATTERN = r"\b(?:rain|rainy|snow|snowy|storm|thunderstorm|cold|wind|windy)\b"
+# Explicit requests for optional groups ("bring a scarf", "wear a dress")
+CATEGORY_KEYWORDS = {
+    "dress": r"\b(?:dress|dresses|jumpsuits?|suits?)\b",
+    "accessory": r"\b(?:accessory|accessories|bags?|scarf|scarves|hats?|belts?|jewelry|jewellery)\b",
+}
+
+
+def parse_context_hints(context):
+    """
+    Extracts structured retrieval hints from a free-form stylist context.
+    Understands the weather string the Raspberry Pi client appends
+    (e.g. "Rainy, High: 12°C, Low: 5°C") plus a few occasion keywords.
+    Returns a dict with season patterns, formality and required category groups.
+    """
+    text = context.lower()
+
+    # 1. Season from temperature, falling back to season words in the text
+    high = re.search(r"high:\s*(-?\d+(?:\.\d+)?)", text)
+    low = re.search(r"low:\s*(-?\d+(?:\.\d+)?)", text)
+    season = None
+    if high or low:
+        temps = [float(m.group(1)) for m in (high, low) if m]
+        avg_temp = sum(temps) / len(temps)
+        if avg_temp >= 22:
+            season = "summer"
+        elif avg_temp <= 8:
+            season = "winter"
+        else:
+            season = "transitional"
+    else:
+        match = re.search(r"\b(summer|winter|spring|autumn|fall)\b", text)
+        if match:
+            season = match.group(1) if match.group(1) in ("summer", "winter") else "transitional"
+
+    # 2. Formality from the occasion
+    formality = "casual"
+    for level, pattern in FORMALITY_RULES:
+        if re.search(pattern, text):
+            formality = level
+            break
+
+    # 3. Categories a complete outfit needs, plus anything the user asked for explicitly
+    required = ["top", "bottom", "footwear"]
+    if season == "winter" or formality == "formal" or re.search(COLD_OR_WET_PATTERN, text):
+        required.append("outerwear")
+    for group, pattern in CATEGORY_KEYWORDS.items():
+        if re.search(pattern, text):
+            required.append(group)
+
+    return {
+        "season": season,
+        "season_patterns": SEASON_PATTERNS.get(season, []),
+        "formality": formality,
+        "categories": required,
+    }
+
+
+def retrieve_balanced_candidates(cur, user_id, query_vec, hints, per_category=CANDIDATES_PER_CATEGORY, tactile_vec=None):
+    """
+    Hybrid retrieval over the user's partition, in one query.
+    For each required category group a LATERAL subquery takes the nearest
+    ANN_POOL_PER_CATEGORY items by semantic distance. That subquery filters on
+    user_id and orders by the indexed distance, so it runs on the partition's
+    HNSW index. HNSW applies the category filter after the index scan, so the
+    scan is iterative (hnsw.iterative_scan): it keeps walking the graph until
+    the group has enough rows, and groups far from the context (often
+    footwear) still fill up. The pool is then re-ranked: items matching the season hint
+    come first (a soft filter, so a sparse closet still yields a full
+    candidate set). If tactile_vec is given, the tactile distance is added to
+    the semantic distance; items without tactile data count as the furthest
+    possible feel (TACTILE_MAX_DISTANCE). The top `per_category` items per
+    group are kept.
+    Each item is in at most one group (see category_group_patterns).
+    """
+    params = []
+    if hints["season_patterns"]:
+        season_sql = "COALESCE(c.season ~* ANY(%s), false)"
+        params.append(hints["season_patterns"])
+    else:
+        season_sql = "true"
+    distance_sql = "c.distance"
+    if tactile_vec is not None:
+        distance_sql += " + %s * COALESCE(c.tactile_embedding <-> %s::vector, %s)"
+        params.extend([TACTILE_WEIGHT, str(tactile_vec), TACTILE_MAX_DISTANCE])
+
+    values_sql = []
+    for group in hints["categories"]:
+        values_sql.append("(%s, %s, %s)")
+        params.extend([group, *category_group_patterns(group)])
+    params.extend([str(query_vec), user_id, str(query_vec), ANN_POOL_PER_CATEGORY, per_category])
+
+    # SET LOCAL only lasts until the end of the current transaction
+    cur.execute("SET LOCAL hnsw.iterative_scan = relaxed_order")
+    cur.execute("SET LOCAL hnsw.ef_search = %s", (HNSW_EF_SEARCH,))
+    cur.execute(f"""
+        SELECT id, category, material_inference, color, season, category_group
+        FROM (
+            SELECT c.id, c.category, c.material_inference, c.color, c.season, g.category_group,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY g.category_group
+                       ORDER BY {season_sql} DESC, {distance_sql}
+                   ) AS group_rank
+            FROM (VALUES {', '.join(values_sql)}) AS g(category_group, pattern, overridden)
+            CROSS JOIN LATERAL (
+                SELECT id, category, material_inference, color, season, tactile_embedding,
+                       semantic_embedding <=> %s::vector AS distance
+                FROM wardrobe_items
+                WHERE user_id = %s AND category ~* g.pattern AND category !~* g.overridden
+                ORDER BY semantic_embedding <=> %s::vector
+                LIMIT %s
+            ) c
+        ) ranked
+        WHERE group_rank <= %s
+        ORDER BY category_group, group_rank
+    """, params)
+    return cur.fetchall()
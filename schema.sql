@@ -0,0 +1,59 @@
+-- AlloyDB / PostgreSQL schema for the wardrobe service.
+-- Requires the pgvector extension (bundled with AlloyDB), version 0.8 or later:
+-- retrieval.py filters HNSW scans by category and relies on iterative index
+-- scans (hnsw.iterative_scan) to fill every category group.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- One row per household. Clients authenticate with a bearer token; only its
+-- SHA-256 is stored. Create users with: python app.py add-user <user_id>
+CREATE TABLE IF NOT EXISTS wardrobe_users (
+    user_id    TEXT PRIMARY KEY,
+    token_hash TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- One partition per user (LIST on user_id), named wardrobe_items_u_<hash>.
+-- accounts.py creates a user's partition when the user is added; every query
+-- filters on user_id so the planner prunes to that single partition and its
+-- local indexes.
+CREATE TABLE IF NOT EXISTS wardrobe_items (
+    id                 BIGINT GENERATED ALWAYS AS IDENTITY,
+    user_id            TEXT NOT NULL,
+    image_base64       TEXT,
+    tactile_roughness  REAL,
+    tactile_stiffness  REAL,
+    category           TEXT,
+    color              TEXT,
+    material_inference TEXT,
+    brand              TEXT,
+    season             TEXT,
+    visual_embedding   vector(1408),
+    semantic_embedding vector(768),
+    tactile_embedding  vector(8),
+    created_at         TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, id)
+) PARTITION BY LIST (user_id);
+
+-- Indexes declared on the parent are created on every partition, so each user
+-- gets their own (small) ANN indexes.
+CREATE INDEX IF NOT EXISTS wardrobe_items_created_idx
+    ON wardrobe_items (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS wardrobe_items_semantic_hnsw
+    ON wardrobe_items USING hnsw (semantic_embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS wardrobe_items_visual_hnsw
+    ON wardrobe_items USING hnsw (visual_embedding vector_cosine_ops);
+
+-- Migrating an existing single-user table (all rows go to one owner):
+--
+--   -- apply migrations/001_add_tactile_embedding.sql first if it has not been run
+--   ALTER TABLE wardrobe_items RENAME TO wardrobe_items_legacy;
+--   -- run the statements above, then create the owner and their partition:
+--   --   python app.py add-user <user>
+--   INSERT INTO wardrobe_items (user_id, image_base64, tactile_roughness, tactile_stiffness,
+--       category, color, material_inference, brand, season,
+--       visual_embedding, semantic_embedding, tactile_embedding, created_at)
+--   SELECT '<user>', image_base64, tactile_roughness, tactile_stiffness,
+--       category, color, material_inference, brand, season,
+--       visual_embedding, semantic_embedding, tactile_embedding, created_at
+--   FROM wardrobe_items_legacy;
@@ -0,0 +1,121 @@
+import numpy as np
+
+# --- CONFIGURATION ---
+# Tactile rig: raw sample payloads accepted by /api/ingest
+# Channel 0 = normal force while the probe presses into the fabric,
+# channel 1 = shear/vibration while it slides across it.
+TACTILE_DTYPES = {"float32": "<f4", "int16": "<i2"}
+TACTILE_FEATURE_DIM = 8
+# Range of each feature vector component (see extract_tactile_features);
+# curvature and tanh(peak) can be negative
+TACTILE_FEATURE_RANGES = [(0, 1), (0, 1), (0, 1), (0, 1), (0, 1), (-1, 1), (-1, 1), (0, 1)]
+# Largest possible L2 distance between two feature vectors (sqrt(14), about 3.74)
+TACTILE_MAX_DISTANCE = float(np.sqrt(sum((hi - lo) ** 2 for lo, hi in TACTILE_FEATURE_RANGES)))
+TACTILE_ROUGHNESS_CUTOFF_HZ = 100.0
+TACTILE_STIFFNESS_REF = 1.0  # Force rise per second (normalized units) that maps to stiffness ~0.63
+# Weight of the tactile distance when it is combined with the semantic distance
+TACTILE_WEIGHT = 0.3
+
+
+def parse_tactile_samples(raw_bytes, dtype="float32", channels=2):
+    """
+    Wraps a raw little-endian sample buffer from the tactile rig in a NumPy
+    array without copying it. Samples are interleaved per channel.
+    Returns an array of shape (n_samples, channels).
+    """
+    if dtype not in TACTILE_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {list(TACTILE_DTYPES)}")
+    if channels < 1:
+        raise ValueError("channels must be at least 1")
+    np_dtype = np.dtype(TACTILE_DTYPES[dtype])
+    frame_size = np_dtype.itemsize * channels
+    if not raw_bytes or len(raw_bytes) % frame_size:
+        raise ValueError(f"Payload of {len(raw_bytes)} bytes is not a whole number of {channels}-channel {dtype} frames")
+
+    samples = np.frombuffer(raw_bytes, dtype=np_dtype).reshape(-1, channels)
+    if len(samples) < 16:
+        raise ValueError("Need at least 16 samples per channel")
+    if samples.dtype.kind == "f" and not np.isfinite(samples).all():
+        raise ValueError("Samples contain NaN or infinite values")
+    return samples
+
+
+def extract_tactile_features(samples, sample_rate):
+    """
+    Computes tactile features from raw samples (see parse_tactile_samples).
+    Returns a dict with roughness and stiffness scalars (0-1; stiffness is None
+    without a force channel) and a fixed-length feature vector for similarity search.
+    Raises ValueError if sample_rate is not a positive finite number.
+    """
+    if not np.isfinite(sample_rate) or sample_rate <= 0:
+        raise ValueError(f"sample_rate must be a positive number, got {sample_rate}")
+    if samples.dtype.kind == "i":
+        samples = samples / np.float32(np.iinfo(samples.dtype).max + 1)
+    samples = samples.astype(np.float32, copy=False)
+
+    # 1. Spectral roughness from the vibration channel (the only channel on single-channel rigs)
+    vibration = samples[:, 1] if samples.shape[1] > 1 else samples[:, 0]
+    vibration = vibration - vibration.mean()
+    power = np.abs(np.fft.rfft(vibration * np.hanning(len(vibration)))) ** 2
+    freqs = np.fft.rfftfreq(len(vibration), d=1.0 / sample_rate)
+    total_power = power.sum()
+    if total_power > 0:
+        centroid = float((freqs * power).sum() / total_power) / (sample_rate / 2)
+        high_freq_ratio = float(power[freqs >= TACTILE_ROUGHNESS_CUTOFF_HZ].sum() / total_power)
+    else:
+        centroid, high_freq_ratio = 0.0, 0.0
+    vibration_rms = float(np.sqrt(np.mean(vibration ** 2)))
+    roughness = float(np.clip(0.5 * high_freq_ratio + 0.5 * centroid, 0, 1))
+
+    # 2. Stiffness curve from the force channel: fit force against time over the press phase
+    stiffness = None
+    slope, curvature, peak, relaxation = 0.0, 0.0, 0.0, 0.0
+    if samples.shape[1] > 1:
+        force = samples[:, 0]
+        peak_index = int(np.argmax(force))
+        press = force[:peak_index + 1]
+        if len(press) >= 3:
+            t = np.arange(len(press)) / sample_rate
+            quad, lin, _ = np.polyfit(t, press, 2)
+            slope = float(lin + quad * t[-1])  # mean rise rate over the press
+            curvature = float(np.tanh(quad * t[-1] / lin)) if lin else 0.0
+        peak = float(force[peak_index])
+        hold = force[peak_index:]
+        if peak > 0 and len(hold) > 1:
+            # How much the fabric relaxes after the peak (viscoelastic give)
+            relaxation = float(np.clip(1 - hold[-max(1, len(hold) // 5):].mean() / peak, 0, 1))
+        stiffness = float(1 - np.exp(-max(slope, 0.0) / TACTILE_STIFFNESS_REF))
+
+    vector = [
+        roughness,
+        centroid,
+        high_freq_ratio,
+        float(np.tanh(vibration_rms * 10)),
+        stiffness or 0.0,
+        curvature,
+        float(np.tanh(peak)),
+        relaxation,
+    ]
+    if not np.isfinite(vector).all():
+        raise ValueError("Samples produced non-finite features")
+    return {"roughness": roughness, "stiffness": stiffness, "vector": vector}
+
+
+def parse_tactile_vector(values):
+    """
+    Validates a client-supplied tactile feature vector (e.g. from an ingested item).
+    Components must lie in TACTILE_FEATURE_RANGES, so distances stay within
+    TACTILE_MAX_DISTANCE. Returns it as a list of floats or raises ValueError.
+    """
+    if not isinstance(values, list) or len(values) != TACTILE_FEATURE_DIM:
+        raise ValueError(f"tactile_vector must be a list of {TACTILE_FEATURE_DIM} numbers")
+    try:
+        vector = [float(x) for x in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"tactile_vector must be a list of {TACTILE_FEATURE_DIM} numbers")
+    if not np.isfinite(vector).all():
+        raise ValueError("tactile_vector values must be finite")
+    for i, (x, (lo, hi)) in enumerate(zip(vector, TACTILE_FEATURE_RANGES)):
+        if not lo <= x <= hi:
+            raise ValueError(f"tactile_vector[{i}] must be between {lo} and {hi}")
+    return vector
@@ -0,0 +1,121 @@
+import pytest
+from psycopg2 import errors
+
+import accounts
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeCursor:
+    """Answers the pg_inherits lookup from `partitions` and records executed statements."""
+
+    def __init__(self, partitions=(), create_error=None, created_by_other=False):
+        self.connection = FakeConnection()
+        self.partitions = set(partitions)
+        self.create_error = create_error
+        self.created_by_other = created_by_other
+        self.executed = []
+        self._row = None
+
+    def execute(self, query, params=None):
+        text = query if isinstance(query, str) else repr(query)
+        self.executed.append(text)
+        if "pg_inherits" in text:
+            self._row = (1,) if params[0] in self.partitions else None
+        elif "CREATE TABLE" in text:
+            if self.create_error:
+                if self.created_by_other:
+                    self.partitions.add("FOR VALUES IN ('alice')")
+                raise self.create_error
+
+    def fetchone(self):
+        return self._row
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    accounts._known_partitions.clear()
+    accounts._token_cache.clear()
+
+
+def test_token_from_request():
+    assert accounts.token_from_request({"Authorization": "Bearer abc"}, {}) == "abc"
+    assert accounts.token_from_request({}, {accounts.TOKEN_COOKIE: "xyz"}) == "xyz"
+    assert accounts.token_from_request({"Authorization": "Basic abc"}, {}) is None
+    assert accounts.token_from_request({"X-User-Id": "alice"}, {}) is None
+
+
+def test_partition_name_is_stable_and_never_a_plain_user_name():
+    name = accounts.partition_name("legacy")
+    assert name == accounts.partition_name("legacy")
+    assert name != "wardrobe_items_legacy"
+    assert accounts.partition_name("Alice") != accounts.partition_name("alice")
+    assert len(accounts.partition_name("x" * 48)) <= 63
+
+
+def test_existing_partition_is_not_recreated():
+    cur = FakeCursor(partitions={"FOR VALUES IN ('alice')"})
+    accounts.ensure_user_partition(cur, "alice")
+    assert not any("CREATE TABLE" in q for q in cur.executed)
+
+
+def test_missing_partition_is_created_and_committed():
+    cur = FakeCursor()
+    accounts.ensure_user_partition(cur, "alice")
+    assert any("CREATE TABLE" in q for q in cur.executed)
+    assert cur.connection.commits == 1
+    # Cached afterwards: no more catalog lookups
+    cur.executed.clear()
+    accounts.ensure_user_partition(cur, "alice")
+    assert cur.executed == []
+
+
+def test_concurrent_creation_is_tolerated():
+    cur = FakeCursor(create_error=errors.DuplicateTable(), created_by_other=True)
+    accounts.ensure_user_partition(cur, "alice")
+    assert cur.connection.rollbacks == 1
+    assert "alice" in accounts._known_partitions
+
+
+def test_name_clash_is_raised_not_ignored():
+    cur = FakeCursor(create_error=errors.DuplicateTable())
+    with pytest.raises(errors.DuplicateTable):
+        accounts.ensure_user_partition(cur, "alice")
+    assert "alice" not in accounts._known_partitions
+
+
+def test_lookup_user_uses_token_hash():
+    class UserCursor:
+        def execute(self, query, params):
+            self.params = params
+
+        def fetchone(self):
+            return ("alice",) if self.params[0] == accounts.hash_token("secret") else None
+
+    cur = UserCursor()
+    assert accounts.lookup_user(cur, "secret") == "alice"
+    assert accounts.lookup_user(cur, "guess") is None
+
+
+def test_resolved_tokens_are_answered_without_the_database():
+    class UserCursor:
+        def execute(self, query, params):
+            self.params = params
+
+        def fetchone(self):
+            return ("alice",)
+
+    assert accounts.cached_user("secret") is None
+    accounts.lookup_user(UserCursor(), "secret")
+    assert accounts.cached_user("secret") == "alice"
+    assert accounts.cached_user("guess") is None
@@ -0,0 +1,154 @@
+import datetime
+
+import pytest
+
+import prompt_builder
+from prompt_builder import build_prompt, encode_candidates, encode_json_indented, estimate_tokens
+
+FIELDS = ["id", "category", "color", "material", "season"]
+
+
+def closet(n):
+    categories = ["Shirt", "Jeans", "Sneakers"]
+    return [{"id": i, "category": categories[i % 3], "color": "Navy blue",
+             "material": "Cotton blend", "season": "Spring/Fall"} for i in range(n)]
+
+
+def test_repeated_values_go_into_the_legend():
+    table = encode_candidates(closet(4), FIELDS).splitlines()
+    assert table[0].startswith("Legend: ")
+    assert "@1=Navy blue" in table[0] or "@1=Cotton blend" in table[0]
+    assert table[1] == "id|category|color|material|season"
+    assert len(table) == 6
+    assert "Navy blue" not in "\n".join(table[2:])
+
+
+def test_unique_and_short_values_are_kept_inline():
+    table = encode_candidates([{"id": 1, "color": "Red"}, {"id": 2, "color": "Red"}, {"id": 3, "color": "Teal|Blue"}],
+                              ["id", "color"])
+    assert table.splitlines() == ["id|color", "1|Red", "2|Red", "3|Teal/Blue"]
+
+
+def test_estimate_does_not_undercount_dense_tables():
+    # Every code, digit run and separator is at least one token
+    assert estimate_tokens("@1|@2|@3") >= 8
+
+
+def test_prompt_within_budget_keeps_everything():
+    prompt, kept, stats = build_prompt("Inventory:", closet(5), FIELDS, budget=10_000)
+    assert kept == closet(5)
+    assert stats["trimmed_tokens"] == 0
+    assert stats["candidates_dropped"] == 0
+    assert stats["token_count"] == "estimated"
+    assert prompt.startswith("Inventory:\n")
+
+
+def test_trimming_drops_least_relevant_and_respects_budget():
+    candidates = closet(25)
+    _, _, full = build_prompt("Inventory:", candidates, FIELDS, budget=10_000, prefix_tokens=200)
+    budget = full["prompt_tokens"] - 60
+    prompt, kept, stats = build_prompt("Inventory:", candidates, FIELDS, budget=budget, prefix_tokens=200)
+
+    assert stats["prompt_tokens"] <= budget
+    assert estimate_tokens(prompt) + 200 == stats["prompt_tokens"]
+    assert kept == candidates[:len(kept)]
+    assert stats["trimmed_tokens"] == full["prompt_tokens"] - stats["prompt_tokens"]
+    # Compaction savings are measured on the full list, independent of trimming
+    assert stats["compaction_saved_tokens"] == full["compaction_saved_tokens"]
+
+
+def test_baseline_uses_the_agents_previous_encoding():
+    lines = lambda candidates, fields: "".join(f"- ID {c['id']}\n" for c in candidates)
+    _, _, json_stats = build_prompt("x", closet(10), FIELDS, 10_000, baseline_encoder=encode_json_indented)
+    _, _, line_stats = build_prompt("x", closet(10), FIELDS, 10_000, baseline_encoder=lines)
+    assert json_stats["baseline_tokens"] > line_stats["baseline_tokens"]
+    assert json_stats["compaction_saved_tokens"] > 0
+
+
+def test_exact_counter_is_reported():
+    _, _, stats = build_prompt("x", closet(3), FIELDS, 10_000, count_tokens=len)
+    assert stats["token_count"] == "exact"
+
+
+# --- Instruction prefix caching, with local fakes for the Vertex SDK ---
+
+class FakeModel:
+    def __init__(self, model_name=None, system_instruction=None, cached_content=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    @classmethod
+    def from_cached_content(cls, cached_content):
+        if cached_content.broken:
+            raise AttributeError("from_cached_content failed")
+        return cls(cached_content=cached_content)
+
+
+class FakeCachedContent:
+    created = []
+    fail_create = False
+    broken = False
+
+    def __init__(self):
+        self.deleted = False
+
+    @classmethod
+    def create(cls, **kwargs):
+        if cls.fail_create:
+            raise ValueError("cached content is too small")
+        cache = cls()
+        cls.created.append(cache)
+        return cache
+
+    def delete(self):
+        self.deleted = True
+
+
+class FakeCaching:
+    CachedContent = FakeCachedContent
+
+
+@pytest.fixture
+def fake_vertex(monkeypatch):
+    FakeCachedContent.created = []
+    FakeCachedContent.fail_create = False
+    FakeCachedContent.broken = False
+    monkeypatch.setattr(prompt_builder, "caching", FakeCaching)
+    monkeypatch.setattr(prompt_builder, "GenerativeModel", FakeModel)
+    monkeypatch.setattr(prompt_builder, "_instruction_models", {})
+    return FakeCachedContent
+
+
+def test_short_prefix_uses_local_model_without_calling_vertex(fake_vertex):
+    model, is_vertex = prompt_builder.get_instruction_model("k", "gemini", "Be brief.")
+    assert not is_vertex
+    assert model.system_instruction == "Be brief."
+    assert fake_vertex.created == []
+    # Built once and reused
+    assert prompt_builder.get_instruction_model("k", "gemini", "Be brief.")[0] is model
+
+
+def test_large_prefix_is_cached_on_vertex(fake_vertex):
+    model, is_vertex = prompt_builder.get_instruction_model("k", "gemini", "x", prefix_tokens=5000)
+    assert is_vertex
+    assert model.cached_content is fake_vertex.created[0]
+
+
+def test_failed_cache_is_deleted_and_retried_later(fake_vertex):
+    fake_vertex.broken = True
+    model, is_vertex = prompt_builder.get_instruction_model("k", "gemini", "x", prefix_tokens=5000)
+    assert not is_vertex
+    assert fake_vertex.created[0].deleted
+
+    # Within the retry window the local model is reused without another attempt
+    assert prompt_builder.get_instruction_model("k", "gemini", "x", prefix_tokens=5000)[0] is model
+    assert len(fake_vertex.created) == 1
+
+    # After the window Vertex is tried again
+    fake_vertex.broken = False
+    key_entry = prompt_builder._instruction_models["k"]
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    prompt_builder._instruction_models["k"] = (key_entry[0], past, False)
+    _, is_vertex = prompt_builder.get_instruction_model("k", "gemini", "x", prefix_tokens=5000)
+    assert is_vertex
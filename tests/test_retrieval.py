@@ -0,0 +1,140 @@
+import re
+
+import numpy as np
+import pytest
+
+from retrieval import CATEGORY_GROUPS, category_group_patterns, parse_context_hints, retrieve_balanced_candidates
+from tactile import TACTILE_FEATURE_RANGES
+
+
+def pg_regex_matches(patterns, value):
+    # The patterns use Postgres word boundaries (\m, \M); translate them for Python's re
+    return any(re.search(p.replace(r"\m", r"\b").replace(r"\M", r"\b"), value, re.I) for p in patterns)
+
+
+def category_groups_of(category):
+    # Same test as the retrieval query: `category ~* pattern AND category !~* overridden`
+    groups = []
+    for group in CATEGORY_GROUPS:
+        pattern, overridden = category_group_patterns(group)
+        if pg_regex_matches([pattern], category) and not pg_regex_matches([overridden], category):
+            groups.append(group)
+    return groups
+
+
+@pytest.mark.parametrize("context, formality", [
+    ("Brunch with friends", "casual"),
+    ("Workout at gym", "athletic"),
+    ("Gym after work", "athletic"),
+    ("Keyboard update call", "casual"),
+    ("Client presentation", "formal"),
+    ("Team meeting at the office", "smart casual"),
+    ("Dinner date", "smart casual"),
+])
+def test_formality(context, formality):
+    assert parse_context_hints(context)["formality"] == formality
+
+
+@pytest.mark.parametrize("context, expected", [
+    ("A suitable outfit for a picnic", []),
+    ("Watch the demo", []),
+    ("That looks fine", []),
+    ("Cocktail party, wearing a dress", ["dress"]),
+    ("Bring a scarf and a hat", ["accessory"]),
+])
+def test_optional_categories_need_whole_words(context, expected):
+    categories = parse_context_hints(context)["categories"]
+    assert [c for c in categories if c in ("dress", "accessory")] == expected
+
+
+def test_season_from_pi_weather_string():
+    context = "Event: Lunch. Location: Rome [Weather at Rome: Clear, High: 28.5°C, Low: 19°C]"
+    hints = parse_context_hints(context)
+    assert hints["season"] == "summer"
+    assert "outerwear" not in hints["categories"]
+
+
+def test_cold_or_wet_weather_adds_outerwear():
+    hints = parse_context_hints("[Weather at Oslo: Snowy, High: 1°C, Low: -6°C]")
+    assert hints["season"] == "winter"
+    assert "outerwear" in hints["categories"]
+
+
+def test_season_words_need_whole_words():
+    assert parse_context_hints("Trip to Springfield")["season"] is None
+    assert parse_context_hints("Autumn walk")["season"] == "transitional"
+
+
+def test_summer_patterns_do_not_match_fall():
+    patterns = parse_context_hints("High: 30°C, Low: 20°C")["season_patterns"]
+    assert pg_regex_matches(patterns, "Summer")
+    assert pg_regex_matches(patterns, "All-season")
+    assert pg_regex_matches(patterns, "Year round")
+    assert not pg_regex_matches(patterns, "Fall")
+    assert not pg_regex_matches(patterns, "Fall/Winter")
+    assert not pg_regex_matches(patterns, "Fall season")
+
+
+class RecordingCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self.query = query
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.mark.parametrize("tactile_vec", [None, [0.1] * 8])
+def test_retrieval_query_is_scoped_and_uses_the_ann_order(tactile_vec):
+    hints = parse_context_hints("Client presentation [Weather: Rainy, High: 12°C, Low: 5°C]")
+    cur = RecordingCursor()
+    retrieve_balanced_candidates(cur, "alice", [0.0] * 768, hints, tactile_vec=tactile_vec)
+
+    assert cur.query.count("%s") == len(cur.params)
+    assert "user_id = %s" in cur.query
+    assert "LATERAL" in cur.query
+    # The inner ORDER BY must be the bare indexed distance for the HNSW index to apply
+    assert "ORDER BY semantic_embedding <=> %s::vector" in cur.query
+    assert "alice" in cur.params
+
+
+def test_retrieval_scans_the_index_until_every_group_is_filled():
+    cur = RecordingCursor()
+    retrieve_balanced_candidates(cur, "alice", [0.0] * 768, parse_context_hints("Lunch"))
+    # The category filter runs after the HNSW scan; only an iterative scan keeps far groups from coming back empty
+    assert "SET LOCAL hnsw.iterative_scan = relaxed_order" in cur.queries
+
+
+@pytest.mark.parametrize("category, groups", [
+    ("Short-sleeve shirt", ["top"]),
+    ("T-shirt", ["top"]),
+    ("Denim shorts", ["bottom"]),
+    ("Boot-cut jeans", ["bottom"]),
+    ("Jean jacket", ["outerwear"]),
+    ("Trench coat", ["outerwear"]),
+    ("Shirt dress", ["dress"]),
+    ("Dress shirt", ["top"]),
+    ("Dress shoes", ["footwear"]),
+    ("Ankle boots", ["footwear"]),
+    ("Two-piece suit", ["dress"]),
+    ("Swimsuit", []),
+    ("Tracksuit", []),
+    ("Petticoat", []),
+])
+def test_each_category_falls_in_its_head_noun_group(category, groups):
+    assert category_groups_of(category) == groups
+
+
+def test_items_without_tactile_data_rank_below_measured_ones():
+    request = [lo for lo, _ in TACTILE_FEATURE_RANGES]
+    furthest = [hi for _, hi in TACTILE_FEATURE_RANGES]
+    cur = RecordingCursor()
+    retrieve_balanced_candidates(cur, "alice", [0.0] * 768, parse_context_hints("Lunch"), tactile_vec=request)
+    # COALESCE(c.tactile_embedding <-> request, penalty): the penalty follows the request vector
+    missing_penalty = cur.params[cur.params.index(str(request)) + 1]
+    assert np.linalg.norm(np.subtract(furthest, request)) <= missing_penalty
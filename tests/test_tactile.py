@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from tactile import (TACTILE_FEATURE_DIM, TACTILE_FEATURE_RANGES, TACTILE_MAX_DISTANCE, extract_tactile_features,
+                     parse_tactile_samples, parse_tactile_vector)
+
+SAMPLE_RATE = 1000
+
+
+def press_and_slide(n=2000):
+    """Force ramps up for one second then holds; vibration is a 250 Hz texture."""
+    t = np.arange(n) / SAMPLE_RATE
+    force = np.minimum(t, 1.0) * 0.8
+    vibration = 0.05 * np.sin(2 * np.pi * 250 * t)
+    return np.stack([force, vibration], axis=1)
+
+
+def test_float32_payload_is_parsed_without_copying():
+    raw = press_and_slide().astype("<f4").tobytes()
+    samples = parse_tactile_samples(raw, "float32", 2)
+    assert samples.shape == (2000, 2)
+    assert not samples.flags.owndata
+
+
+def test_int16_and_float32_give_the_same_features():
+    signal = press_and_slide()
+    as_float = extract_tactile_features(parse_tactile_samples(signal.astype("<f4").tobytes(), "float32", 2), SAMPLE_RATE)
+    as_int = extract_tactile_features(parse_tactile_samples((signal * 32767).astype("<i2").tobytes(), "int16", 2), SAMPLE_RATE)
+    assert np.allclose(as_float["vector"], as_int["vector"], atol=1e-3)
+
+
+def test_features_are_fixed_length_and_bounded():
+    features = extract_tactile_features(parse_tactile_samples(press_and_slide().astype("<f4").tobytes()), SAMPLE_RATE)
+    assert len(features["vector"]) == TACTILE_FEATURE_DIM
+    assert 0 <= features["roughness"] <= 1
+    assert 0 < features["stiffness"] < 1
+
+
+def test_single_channel_has_no_stiffness():
+    vibration = press_and_slide()[:, 1].astype("<f4").tobytes()
+    features = extract_tactile_features(parse_tactile_samples(vibration, "float32", 1), SAMPLE_RATE)
+    assert features["stiffness"] is None
+    assert features["vector"][4:] == [0.0, 0.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize("raw, dtype, channels", [
+    (b"abc", "int16", 2),
+    (b"", "float32", 2),
+    (np.zeros((8, 2), "<f4").tobytes(), "float32", 2),
+    (np.zeros((32, 2), "<f4").tobytes(), "float64", 2),
+    (np.zeros((32, 2), "<f4").tobytes(), "float32", 0),
+])
+def test_malformed_payloads_are_rejected(raw, dtype, channels):
+    with pytest.raises(ValueError):
+        parse_tactile_samples(raw, dtype, channels)
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf])
+def test_non_finite_samples_are_rejected(bad):
+    signal = press_and_slide().astype("<f4")
+    signal[10, 1] = bad
+    with pytest.raises(ValueError):
+        parse_tactile_samples(signal.tobytes())
+
+
+@pytest.mark.parametrize("rate", [0, -1000, float("nan"), float("inf")])
+def test_invalid_sample_rate_is_rejected(rate):
+    samples = parse_tactile_samples(press_and_slide().astype("<f4").tobytes())
+    with pytest.raises(ValueError):
+        extract_tactile_features(samples, rate)
+
+
+def test_parse_tactile_vector():
+    assert parse_tactile_vector([1, "0.5", 0, 0, 0, 0, 0, 0]) == [1.0, 0.5, 0, 0, 0, 0, 0, 0]
+    assert parse_tactile_vector([0, 0, 0, 0, 0, -1, -1, 0])[5:7] == [-1.0, -1.0]
+    for bad in ([0] * 7, "x" * 8, [None] * 8, ["a"] * 8, [float("nan")] * 8, {"a": 1},
+                [2, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, -1.5, 0, 0]):
+        with pytest.raises(ValueError):
+            parse_tactile_vector(bad)
+
+
+def test_features_stay_within_their_ranges():
+    signal = press_and_slide()
+    # Force falling while pressed (negative peak and curvature) plus broadband noise
+    signal[:, 0] = -signal[:, 0] ** 2
+    signal[:, 1] += np.random.default_rng(0).normal(0, 0.5, len(signal))
+    for samples in (press_and_slide(), signal):
+        vector = extract_tactile_features(samples.astype(np.float32), SAMPLE_RATE)["vector"]
+        assert all(lo <= x <= hi for x, (lo, hi) in zip(vector, TACTILE_FEATURE_RANGES))
+    corners = np.array(TACTILE_FEATURE_RANGES, dtype=float).T
+    assert np.isclose(np.linalg.norm(corners[1] - corners[0]), TACTILE_MAX_DISTANCE)